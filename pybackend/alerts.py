@@ -22,6 +22,13 @@ class AlertsStore:
     def list(self) -> List[Dict[str, Any]]:
         return list(self._alerts)
 
+    def snapshot(self) -> Dict[str, Any]:
+        return {"alerts": list(self._alerts), "nextId": self._next_id}
+
+    def load(self, state: Dict[str, Any]) -> None:
+        self._alerts = list(state.get("alerts", []))
+        self._next_id = int(state.get("nextId", 1))
+
     @staticmethod
     def _should_trigger(alert: Dict[str, Any], value: float) -> bool:
         op = alert.get("operator")
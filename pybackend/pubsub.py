@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import socket
+from typing import Any, Callable, Dict, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = "GEMSCAP-PUBSUB/1"
+# Analytics payloads carry full price/spread series, so lines can be large.
+LINE_LIMIT = 16 * 1024 * 1024
+# Peers that stop reading are dropped instead of buffering forever.
+MAX_PENDING_BYTES = 8 * 1024 * 1024
+RETRY_DELAY = 1.0
+CALL_TIMEOUT = 5.0
+# Unix socket + lock file where available; loopback TCP is the Windows fallback.
+USE_UNIX = hasattr(socket, "AF_UNIX") and fcntl is not None
+
+# Every line on the wire is "<kind> <body>\n"
+MSG = b"M"     # broadcast payload, relayed to every process
+CALL = b"C"    # follower -> leader: {"id": n, "call": {...}}
+REPLY = b"R"   # leader -> follower: {"id": n, "result": ...}
+STATE = b"S"   # leader -> followers: shared state snapshot
+
+
+class HandshakeError(Exception):
+    pass
+
+
+def _sign(token: str, role: str, nonce: str) -> bytes:
+    return hmac.new(token.encode("utf-8"), f"{role}:{nonce}".encode("utf-8"), hashlib.sha256).hexdigest().encode("ascii")
+
+
+def _line(kind: bytes, body: str) -> bytes:
+    return kind + b" " + body.encode("utf-8") + b"\n"
+
+
+class PubSub:
+    """Local pub/sub channel shared by the worker processes of one host.
+
+    One process is elected leader (it holds a lock file next to the Unix
+    socket, or on Windows binds the TCP port) and the rest connect to it as
+    followers after a token handshake. Broadcasts published by any process
+    are delivered to its own ``on_message`` and relayed through the leader
+    to every other process. State changes go through ``call``: the leader
+    applies them with ``handle_call`` and pushes ``get_state()`` to every
+    follower, which loads it with ``set_state``. If the leader goes away, a
+    follower takes over with the last replicated state.
+
+    ``path`` (Unix) or ``port`` (Windows) is required and must be unique
+    per deployment, otherwise unrelated deployments would elect each other.
+    """
+
+    def __init__(self, token: str, on_message: Callable[[str], None],
+                 on_promote: Callable[[], None],
+                 handle_call: Callable[[Dict[str, Any]], Any],
+                 get_state: Callable[[], Dict[str, Any]],
+                 set_state: Callable[[Dict[str, Any]], None],
+                 path: Optional[str] = None, port: Optional[int] = None,
+                 host: str = "127.0.0.1") -> None:
+        if USE_UNIX and not path:
+            raise ValueError("PubSub needs a socket path")
+        if not USE_UNIX and not port:
+            raise ValueError("PubSub needs a TCP port")
+        self.token = token
+        self.path = path
+        self.port = port
+        self.host = host
+        self.on_message = on_message
+        self.on_promote = on_promote
+        self.handle_call = handle_call
+        self.get_state = get_state
+        self.set_state = set_state
+        self.is_leader = False
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._lock = None
+        self._followers: Set[asyncio.StreamWriter] = set()
+        self._handlers: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+        self._stopping = False
+        self._leader: Optional[asyncio.StreamWriter] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_call = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def address(self) -> str:
+        return self.path if USE_UNIX else f"{self.host}:{self.port}"
+
+    def start(self) -> None:
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        self._task.add_done_callback(self._on_run_done)
+
+    def _on_run_done(self, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("pub/sub on %s stopped; this worker gets no updates", self.address,
+                         exc_info=task.exception())
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._server is not None:
+            self._server.close()
+        # Let follower handlers see EOF and finish on their own; cancelling
+        # them makes asyncio log a CancelledError traceback per connection.
+        for w in list(self._handlers.values()):
+            w.close()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        self._followers.clear()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._leader is not None:
+            self._leader.close()
+            self._leader = None
+        if self._server is not None:
+            await self._server.wait_closed()
+            self._server = None
+        if self.is_leader and USE_UNIX:
+            # Unlink before dropping the lock so the next leader's socket survives
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        self._release_lock()
+        self._fail_pending()
+        self.is_leader = False
+
+    def publish(self, data: str) -> None:
+        self.on_message(data)
+        line = _line(MSG, data)
+        if self.is_leader:
+            self._relay(line)
+        else:
+            self._send_to_leader(line)
+
+    async def call(self, call: Dict[str, Any]) -> Any:
+        """Apply a state change on the leader and return its result.
+
+        Raises ``ConnectionError`` when no leader is reachable and
+        ``asyncio.TimeoutError`` when it does not answer in time.
+        """
+        if self.is_leader:
+            return self._apply(call)
+        self._next_call += 1
+        call_id = self._next_call
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[call_id] = fut
+        try:
+            if not self._send_to_leader(_line(CALL, json.dumps({"id": call_id, "call": call}))):
+                raise ConnectionError("no pub/sub leader available")
+            return await asyncio.wait_for(fut, CALL_TIMEOUT)
+        finally:
+            self._pending.pop(call_id, None)
+
+    def _apply(self, call: Dict[str, Any]) -> Any:
+        result = self.handle_call(call)
+        # Followers load the new state before the caller sees the reply
+        self._relay(_line(STATE, json.dumps(self.get_state())))
+        return result
+
+    def _send_to_leader(self, line: bytes) -> bool:
+        w = self._leader
+        if w is None:
+            return False
+        if w.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+            logger.error("pub/sub leader at %s is not reading; reconnecting", self.address)
+            self._leader = None
+            w.close()
+            return False
+        w.write(line)
+        return True
+
+    def _relay(self, line: bytes, origin: Optional[asyncio.StreamWriter] = None) -> None:
+        for w in list(self._followers):
+            if w is origin:
+                continue
+            if w.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+                logger.warning("dropping pub/sub follower that is not reading")
+                self._followers.discard(w)
+                w.close()
+                continue
+            w.write(line)
+
+    def _fail_pending(self) -> None:
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.set_exception(ConnectionError("pub/sub leader connection lost"))
+        self._pending.clear()
+
+    def _acquire_lock(self) -> bool:
+        try:
+            f = open(self.path + ".lock", "a")
+        except OSError as exc:
+            logger.error("cannot open pub/sub lock file %s.lock: %s", self.path, exc)
+            return False
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock = f
+        return True
+
+    def _release_lock(self) -> None:
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    async def _listen(self) -> Optional[asyncio.AbstractServer]:
+        if not USE_UNIX:
+            try:
+                return await asyncio.start_server(self._handle_follower, self.host, self.port, limit=LINE_LIMIT)
+            except OSError:
+                return None
+        if not self._acquire_lock():
+            return None
+        sock = None
+        try:
+            # Whoever held the lock before us is gone; its socket file is stale
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            old_umask = os.umask(0o177)
+            try:
+                sock.bind(self.path)
+            finally:
+                os.umask(old_umask)
+            return await asyncio.start_unix_server(self._handle_follower, sock=sock, limit=LINE_LIMIT)
+        except OSError as exc:
+            logger.error("cannot listen on pub/sub socket %s: %s", self.path, exc)
+            if sock is not None:
+                sock.close()
+            self._release_lock()
+            return None
+
+    async def _connect(self):
+        if USE_UNIX:
+            return await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+        return await asyncio.open_connection(self.host, self.port, limit=LINE_LIMIT)
+
+    async def _run(self) -> None:
+        while True:
+            self._server = await self._listen()
+            if self._server is not None:
+                self.is_leader = True
+                logger.info("pub/sub leader elected on %s (pid %d)", self.address, os.getpid())
+                self.on_promote()
+                await self._server.serve_forever()
+                return
+            try:
+                reader, writer = await self._connect()
+            except OSError:
+                # Leader is between exiting and a new one listening; try again shortly
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            try:
+                await self._client_handshake(reader, writer)
+            except (HandshakeError, ValueError, ConnectionError,
+                    asyncio.IncompleteReadError, asyncio.TimeoutError) as exc:
+                logger.error("pub/sub handshake with %s failed: %s", self.address, exc)
+                writer.close()
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            self._leader = writer
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    self._dispatch_from_leader(line)
+            except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+                pass
+            finally:
+                if self._leader is writer:
+                    self._leader = None
+                writer.close()
+                self._fail_pending()
+
+    def _dispatch_from_leader(self, line: bytes) -> None:
+        kind, body = line[:1], line[2:].rstrip(b"\n")
+        if kind == MSG:
+            self.on_message(body.decode("utf-8"))
+        elif kind == STATE:
+            self.set_state(json.loads(body))
+        elif kind == REPLY:
+            reply = json.loads(body)
+            fut = self._pending.get(reply.get("id"))
+            if fut is not None and not fut.done():
+                fut.set_result(reply.get("result"))
+
+    async def _client_handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        nonce = secrets.token_hex(16)
+        writer.write(f"{MAGIC} {nonce}\n".encode("ascii"))
+        parts = (await asyncio.wait_for(reader.readline(), CALL_TIMEOUT)).decode("utf-8").split()
+        if len(parts) != 3 or parts[0] != MAGIC:
+            raise HandshakeError("peer is not a pub/sub leader")
+        if not hmac.compare_digest(parts[2].encode("utf-8"), _sign(self.token, "leader", nonce)):
+            raise HandshakeError("leader uses a different PUBSUB_TOKEN")
+        writer.write(_sign(self.token, "follower", parts[1]) + b"\n")
+
+    async def _server_handshake(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        parts = (await asyncio.wait_for(reader.readline(), CALL_TIMEOUT)).decode("utf-8").split()
+        if len(parts) != 2 or parts[0] != MAGIC:
+            raise HandshakeError("peer is not a pub/sub follower")
+        nonce = secrets.token_hex(16)
+        writer.write(f"{MAGIC} {nonce} ".encode("ascii") + _sign(self.token, "leader", parts[1]) + b"\n")
+        answer = (await asyncio.wait_for(reader.readline(), CALL_TIMEOUT)).strip()
+        if not hmac.compare_digest(answer, _sign(self.token, "follower", nonce)):
+            raise HandshakeError("follower uses a different PUBSUB_TOKEN")
+
+    async def _handle_follower(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._handlers[task] = writer
+        try:
+            await self._serve_follower(reader, writer)
+        finally:
+            self._handlers.pop(task, None)
+
+    async def _serve_follower(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            await self._server_handshake(reader, writer)
+        except (HandshakeError, ValueError, ConnectionError,
+                asyncio.IncompleteReadError, asyncio.TimeoutError) as exc:
+            if not self._stopping:
+                logger.error("rejected pub/sub connection on %s: %s", self.address, exc)
+            writer.close()
+            return
+        writer.write(_line(STATE, json.dumps(self.get_state())))
+        self._followers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                kind, body = line[:1], line[2:].rstrip(b"\n")
+                if kind == MSG:
+                    self.on_message(body.decode("utf-8"))
+                    self._relay(line, origin=writer)
+                elif kind == CALL:
+                    req = json.loads(body)
+                    result = self._apply(req["call"])
+                    writer.write(_line(REPLY, json.dumps({"id": req["id"], "result": result})))
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._followers.discard(writer)
+            writer.close()
@@ -2,3 +2,8 @@ python -m pip install -r requirements.txt
  $env:MONGODB_DB='gemscap'
 python -m uvicorn pybackend.server:app --host 0.0.0.0 --port 8080
 
+
+# Multi-worker mode: one leader ingests, every worker serves and fans out
+# $env:PUBSUB_TOKEN='change-me'
+# $env:PUBSUB_PORT='8099'
+# python -m uvicorn pybackend.server:app --host 0.0.0.0 --port 8080 --workers 4
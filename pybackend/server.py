@@ -5,7 +5,7 @@ from starlette.responses import JSONResponse, FileResponse, StreamingResponse, P
 from starlette.routing import Route, WebSocketRoute
 from starlette.endpoints import WebSocketEndpoint
 from starlette.staticfiles import StaticFiles
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 import asyncio
 import json
@@ -19,21 +19,33 @@ try:
     from .data_processor import aggregate_ticks
     from .analytics import compute_analytics, adf_test, calculate_hedge_ratio, calculate_spread
     from .alerts import AlertsStore
+    from .pubsub import PubSub
 except Exception:
     from db import get_db
     from data_processor import aggregate_ticks
     from analytics import compute_analytics, adf_test, calculate_hedge_ratio, calculate_spread
     from alerts import AlertsStore
+    from pubsub import PubSub
 
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PUBLIC_DIR = os.path.join(BASE_DIR, "public")
 alerts = AlertsStore()
 connected_clients: List[Any] = []
+# Set PUBSUB_TOKEN when running with several workers (e.g. uvicorn --workers 4):
+# one elected leader runs ingestion/analytics and every worker fans out updates.
+# PUBSUB_PATH (Unix socket) or, on Windows, PUBSUB_PORT must be unique per deployment.
+PUBSUB_TOKEN = os.environ.get("PUBSUB_TOKEN")
+PUBSUB_PATH = os.environ.get("PUBSUB_PATH")
+PUBSUB_PORT = os.environ.get("PUBSUB_PORT")
+pubsub: Optional[PubSub] = None
 
 
 async def health(request):
-    return JSONResponse({"status": "ok", "time": datetime.utcnow().isoformat()})
+    body = {"status": "ok", "time": datetime.utcnow().isoformat()}
+    if pubsub is not None:
+        body["leader"] = pubsub.is_leader
+    return JSONResponse(body)
 
 
 async def index(request):
@@ -63,6 +75,13 @@ class WS(WebSocketEndpoint):
 
 def broadcast(payload: Dict[str, Any]):
     data = json.dumps(payload)
+    if pubsub is not None:
+        pubsub.publish(data)
+    else:
+        send_to_clients(data)
+
+
+def send_to_clients(data: str):
     for ws in list(connected_clients):
         try:
             asyncio.create_task(ws.send_text(data))
@@ -260,26 +279,48 @@ async def export_csv(request):
     return StreamingResponse(iter([output.getvalue()]), media_type="text/csv", headers=headers)
 
 
+def apply_alert_op(op: Dict[str, Any]) -> Any:
+    # Runs on the pub/sub leader (or the only process), which owns alert ids
+    if op.get("op") == "add":
+        return alerts.add(op["cfg"])
+    if op.get("op") == "remove":
+        alerts.remove(int(op["id"]))
+    return None
+
+
+async def alert_op(op: Dict[str, Any]) -> Any:
+    if pubsub is None:
+        return apply_alert_op(op)
+    return await pubsub.call(op)
+
+
 async def list_alerts(request):
     return JSONResponse(alerts.list())
 
 
 async def create_alert(request):
     body = await request.json()
-    created = alerts.add({
+    cfg = {
         "symbolX": str(body.get("symbolX", "")).upper(),
         "symbolY": str(body.get("symbolY", "")).upper(),
         "metric": body.get("metric"),
         "operator": body.get("operator"),
         "threshold": float(body.get("threshold")),
         "message": body.get("message") or f"{body.get('metric')} {body.get('operator')} {body.get('threshold')}",
-    })
+    }
+    try:
+        created = await alert_op({"op": "add", "cfg": cfg})
+    except (ConnectionError, asyncio.TimeoutError):
+        return JSONResponse({"error": "Alert service unavailable, retry shortly"}, status_code=503)
     return JSONResponse(created)
 
 
 async def delete_alert(request):
     alert_id = int(request.path_params.get("alert_id"))
-    alerts.remove(alert_id)
+    try:
+        await alert_op({"op": "remove", "id": alert_id})
+    except (ConnectionError, asyncio.TimeoutError):
+        return JSONResponse({"error": "Alert service unavailable, retry shortly"}, status_code=503)
     return JSONResponse({"message": "Alert removed successfully!"})
 
 
@@ -395,9 +436,8 @@ async def periodic_analytics(symbol_x: str, symbol_y: str, timeframe: str = "1m"
         await asyncio.sleep(1.0)
 
 
-async def startup():
+def start_ingest():
     # Launch collectors for default symbols and the analytics publisher
-    app.state.tasks = []
     # collectors
     for sym in DEFAULT_SYMBOLS:
         app.state.tasks.append(asyncio.create_task(binance_tick_consumer(sym)))
@@ -406,11 +446,37 @@ async def startup():
         app.state.tasks.append(asyncio.create_task(periodic_analytics(DEFAULT_SYMBOLS[0], DEFAULT_SYMBOLS[1])))
 
 
+async def startup():
+    global pubsub
+    app.state.tasks = []
+    if PUBSUB_TOKEN:
+        if not (PUBSUB_PATH or PUBSUB_PORT):
+            raise RuntimeError("Set PUBSUB_PATH (PUBSUB_PORT on Windows) to a value unique to this deployment")
+        # Only the leader process ingests; the others just serve and fan out
+        pubsub = PubSub(
+            PUBSUB_TOKEN,
+            on_message=send_to_clients,
+            on_promote=start_ingest,
+            handle_call=apply_alert_op,
+            get_state=alerts.snapshot,
+            set_state=alerts.load,
+            path=PUBSUB_PATH,
+            port=int(PUBSUB_PORT) if PUBSUB_PORT else None,
+        )
+        pubsub.start()
+    elif PUBSUB_PATH or PUBSUB_PORT:
+        raise RuntimeError("PUBSUB_TOKEN must be set to run with multiple workers")
+    else:
+        start_ingest()
+
+
 async def shutdown():
     tasks = getattr(app.state, "tasks", [])
     for t in tasks:
         t.cancel()
     await asyncio.gather(*tasks, return_exceptions=True)
+    if pubsub is not None:
+        await pubsub.stop()
 
 
 app.add_event_handler("startup", startup)
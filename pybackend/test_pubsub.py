@@ -0,0 +1,142 @@
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+try:
+    from .pubsub import USE_UNIX
+except Exception:
+    from pubsub import USE_UNIX
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Runs one PubSub peer; reads commands on stdin and reports events on stdout.
+PEER = r"""
+import asyncio, json, logging, sys
+import pubsub
+
+pubsub.RETRY_DELAY = 0.1
+
+
+def emit(*event):
+    print(json.dumps(event), flush=True)
+
+
+async def main(path):
+    state = {"items": []}
+
+    def handle_call(call):
+        state["items"].append(call["value"])
+        return len(state["items"])
+
+    def set_state(new_state):
+        state.update(new_state)
+        emit("state", new_state)
+
+    ps = pubsub.PubSub("test-token", on_message=lambda data: emit("message", data),
+                       on_promote=lambda: emit("promoted"), handle_call=handle_call,
+                       get_state=lambda: dict(state), set_state=set_state, path=path)
+    ps.start()
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    while True:
+        cmd = (await reader.readline()).decode().split()
+        if not cmd or cmd[0] == "exit":
+            break
+        if cmd[0] == "add":
+            emit("added", await ps.call({"op": "add", "value": cmd[1]}))
+    # Shut down straight after stop(), as uvicorn does, so leftover tasks show up
+    await ps.stop()
+    emit("stopped")
+
+
+logging.basicConfig(level=logging.WARNING)
+asyncio.run(main(sys.argv[1]))
+"""
+
+
+class Peer:
+    def __init__(self, path):
+        env = dict(os.environ, PYTHONPATH=HERE)
+        self.proc = subprocess.Popen([sys.executable, "-c", PEER, path], env=env, text=True,
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.events = queue.Queue()
+        self.backlog = []
+        threading.Thread(target=self._pump, daemon=True).start()
+
+    def _pump(self):
+        for line in self.proc.stdout:
+            self.events.put(json.loads(line))
+
+    def send(self, cmd):
+        self.proc.stdin.write(cmd + "\n")
+        self.proc.stdin.flush()
+
+    def wait_for(self, kind, timeout=5.0, match=lambda event: True):
+        # Events that do not match stay queued for later waits
+        deadline = time.monotonic() + timeout
+        while True:
+            for event in self.backlog:
+                if event[0] == kind and match(event):
+                    self.backlog.remove(event)
+                    return event
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                self.backlog.append(self.events.get(timeout=remaining))
+            except queue.Empty:
+                return None
+
+    def close(self):
+        if self.proc.poll() is None:
+            self.send("exit")
+        try:
+            _, err = self.proc.communicate(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            _, err = self.proc.communicate()
+        return err
+
+
+@pytest.mark.skipif(not USE_UNIX, reason="Unix socket transport only")
+def test_election_replication_and_takeover(tmp_path):
+    path = str(tmp_path / "pubsub.sock")
+    peers = []
+    try:
+        for _ in range(3):
+            peers.append(Peer(path))
+            time.sleep(0.2)
+        promoted = [p for p in peers if p.wait_for("promoted", timeout=1.0)]
+        assert len(promoted) == 1
+        leader = promoted[0]
+        followers = [p for p in peers if p is not leader]
+
+        # Every follower has the leader's (empty) snapshot once connected
+        for f in followers:
+            assert f.wait_for("state")
+
+        followers[0].send("add first")
+        assert followers[0].wait_for("added") == ["added", 1]
+        for f in followers:
+            assert f.wait_for("state", match=lambda e: e[1]["items"] == ["first"])
+
+        leader.send("exit")
+        assert leader.wait_for("stopped")
+        promoted = [f for f in followers if f.wait_for("promoted", timeout=3.0)]
+        assert len(promoted) == 1
+        survivor = [f for f in followers if f is not promoted[0]][0]
+
+        # The new leader kept the replicated state
+        survivor.send("add second")
+        assert survivor.wait_for("added") == ["added", 2]
+    finally:
+        errors = [p.close() for p in peers]
+    assert not any("Traceback" in err for err in errors), errors